@@ -1,18 +1,11 @@
 import streamlit as st
-import requests
-import base64
-import os
-import tempfile
-import fitz  # PyMuPDF
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from PIL import Image
 import io
-import time
-import pytesseract
-import cv2
-import numpy as np
+
+from core import (
+    REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, PAGES_PER_REQUEST,
+    connect_to_google_sheets, process_pdf, process_image
+)
 
 # 페이지 설정
 st.set_page_config(page_title="PDF/이미지 텍스트 추출 도구", page_icon="📄", layout="wide")
@@ -34,324 +27,49 @@ with st.sidebar:
         "OCR 방법 선택",
         ["OpenAI (o4-mini)", "Tesseract OCR", "둘 다 사용"]
     )
+    use_text_layer = st.checkbox(
+        "텍스트가 있는 PDF 페이지는 OCR 생략", value=True,
+        help="PDF에 선택 가능한 텍스트가 들어 있는 페이지는 OCR 없이 그 텍스트를 바로 사용합니다. 스캔한 페이지만 OCR로 처리합니다."
+    )
+    use_batch_api = st.checkbox(
+        "Batch API 사용 (저렴, 비동기)", value=False,
+        help="여러 페이지 PDF를 OpenAI Batch API로 처리하여 비용을 50% 절감합니다. 결과가 나오기까지 최대 24시간이 걸릴 수 있으며, 작업 ID가 표시된 뒤 같은 PDF로 다시 실행하면 결과를 가져옵니다."
+    )
+    pages_per_request = st.slider(
+        "요청당 PDF 페이지 수", min_value=1, max_value=8, value=PAGES_PER_REQUEST,
+        help="여러 페이지를 한 번의 OpenAI 요청으로 묶어 보냅니다. 프롬프트가 한 번만 전송되어 요청 수와 토큰 비용이 줄어듭니다."
+    )
+    requests_per_minute = st.number_input(
+        "분당 최대 요청 수 (RPM)", min_value=1, value=REQUESTS_PER_MINUTE,
+        help="OpenAI 계정의 요청 한도에 맞춰 설정하면 한도 안에서 최대한 빠르게 처리합니다."
+    )
+    tokens_per_minute = st.number_input(
+        "분당 최대 토큰 수 (TPM)", min_value=10000, value=TOKENS_PER_MINUTE, step=10000,
+        help="OpenAI 계정의 토큰 한도에 맞춰 설정하세요."
+    )
+    low_memory_mode = st.checkbox(
+        "저메모리 모드", value=False,
+        help="페이지마다 PDF 렌더링 캐시를 비웁니다. 이미지가 많은 PDF의 메모리 사용량이 줄지만 처리 속도가 느려질 수 있습니다."
+    )
     
     st.markdown("---")
     st.markdown("### 참고")
     st.info("업로드한 파일은 서버에 저장되지 않으며, 처리 후 자동으로 삭제됩니다.")
 
-# Google 스프레드시트 연결 함수
-def connect_to_google_sheets(sheet_id):
-    try:
-        # 서비스 계정 정보 (환경 변수 또는 secrets에서 가져옴)
-        # 실제 배포 시에는 Streamlit의 secrets 관리 기능을 사용하는 것이 좋습니다
-        if os.path.exists('service_account.json'):
-            # 로컬 개발 환경
-            creds = Credentials.from_service_account_file(
-                'service_account.json',
-                scopes=['https://www.googleapis.com/auth/spreadsheets',
-                       'https://www.googleapis.com/auth/drive']
-            )
-        else:
-            # Streamlit Cloud 환경
-            service_account_info = st.secrets["gcp_service_account"]
-            creds = Credentials.from_service_account_info(
-                service_account_info,
-                scopes=['https://www.googleapis.com/auth/spreadsheets',
-                       'https://www.googleapis.com/auth/drive']
-            )
-        
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(sheet_id).sheet1
-        return sheet
-    except Exception as e:
-        st.error(f"Google 스프레드시트 연결 오류: {str(e)}")
-        return None
-
-# PDF 페이지를 이미지로 변환하는 함수
-def convert_pdf_page_to_image(pdf_file, page_num):
-    try:
-        # PyMuPDF를 사용하여 PDF 페이지를 이미지로 변환
-        doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-        pdf_file.seek(0)  # 파일 포인터 리셋
-        
-        if page_num >= doc.page_count:
-            return None
-        
-        page = doc.load_page(page_num)
-        pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))  # 300 DPI로 렌더링
-        
-        img_bytes = pix.tobytes("png")
-        return img_bytes
-    except Exception as e:
-        st.error(f"PDF 페이지 변환 오류: {str(e)}")
-        return None
-
-# OpenAI API를 사용하여 이미지에서 텍스트 추출 함수
-def extract_text_with_openai(image_bytes, page_num, api_key):
-    try:
-        # 이미지를 Base64로 인코딩
-        base64_image = base64.b64encode(image_bytes).decode('utf-8')
-        
-        # OpenAI API 요청 설정
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
-        # 요청 페이로드 구성 - Chat Completions API 사용
-        payload = {
-            "model": "o4-mini",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "수식은 LaTeX형식으로 제공해줘. 이미지의 모든 텍스트 내용을 추출해서 원본 서식을 최대한 유지하며 보여줘."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"이 이미지에서 모든 텍스트를 추출해줘."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}",
-                                "detail": "high"
-                            }
-                        }
-                    ]
-                }
-            ]
-        }
-        
-        # API 호출
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
-        
-        # 응답 확인
-        if response.status_code == 200:
-            result = response.json()
-            if "choices" in result and len(result["choices"]) > 0:
-                extracted_text = result["choices"][0]["message"]["content"]
-                return extracted_text
-            else:
-                return "OpenAI로 텍스트를 추출하지 못했습니다."
-        else:
-            st.error(f"API 오류 ({response.status_code}): {response.text}")
-            return f"OpenAI API 오류가 발생했습니다."
-    except Exception as e:
-        st.error(f"OpenAI 텍스트 추출 오류: {str(e)}")
-        return f"OpenAI 텍스트 추출 중 오류 발생: {str(e)}"
-
-# Tesseract OCR을 사용하여 이미지에서 텍스트 추출
-def extract_text_with_tesseract(image_bytes):
-    try:
-        # 이미지 바이트를 NumPy 배열로 변환
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # OpenCV로 이미지 전처리
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        # 노이즈 제거
-        gray = cv2.medianBlur(gray, 3)
-        # 이진화
-        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # Tesseract OCR로 텍스트 추출
-        text = pytesseract.image_to_string(thresh, lang='kor+eng')
-        
-        return text if text.strip() else "Tesseract OCR로 텍스트를 추출하지 못했습니다."
-    except Exception as e:
-        st.error(f"Tesseract OCR 오류: {str(e)}")
-        return f"Tesseract OCR 중 오류 발생: {str(e)}"
-
-# PDF 처리 함수
-def process_pdf(pdf_file, api_key, sheet=None):
-    try:
-        # PDF 파일 정보 확인
-        doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-        pdf_file.seek(0)  # 파일 포인터 리셋
-        page_count = doc.page_count
-        
-        st.info(f"PDF 파일: {pdf_file.name}, 총 {page_count} 페이지")
-        
-        # 진행 상황 표시
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        # 추출 결과를 저장할 리스트
-        extracted_texts = []
-        
-        # 각 페이지 처리
-        for i in range(page_count):
-            # 상태 업데이트
-            status_text.text(f"페이지 {i+1}/{page_count} 처리 중...")
-            progress_bar.progress((i) / page_count)
-            
-            # 페이지를 이미지로 변환
-            img_bytes = convert_pdf_page_to_image(pdf_file, i)
-            if img_bytes:
-                # 선택한 OCR 방법에 따라 텍스트 추출
-                if ocr_method == "OpenAI (o4-mini)":
-                    extracted_text = extract_text_with_openai(img_bytes, i, api_key)
-                    extracted_texts.append({
-                        "페이지": i + 1,
-                        "OpenAI 추출 텍스트": extracted_text
-                    })
-                elif ocr_method == "Tesseract OCR":
-                    extracted_text = extract_text_with_tesseract(img_bytes)
-                    extracted_texts.append({
-                        "페이지": i + 1,
-                        "Tesseract 추출 텍스트": extracted_text
-                    })
-                else:  # 둘 다 사용
-                    openai_text = extract_text_with_openai(img_bytes, i, api_key)
-                    tesseract_text = extract_text_with_tesseract(img_bytes)
-                    extracted_texts.append({
-                        "페이지": i + 1,
-                        "OpenAI 추출 텍스트": openai_text,
-                        "Tesseract 추출 텍스트": tesseract_text
-                    })
-                
-                # API 호출 간 짧은 대기 시간
-                time.sleep(1)
-            else:
-                extracted_texts.append({
-                    "페이지": i + 1,
-                    "OpenAI 추출 텍스트": "페이지 변환 실패",
-                    "Tesseract 추출 텍스트": "페이지 변환 실패"
-                })
-        
-        # 진행 상황 완료
-        progress_bar.progress(1.0)
-        status_text.text("처리 완료!")
-        
-        # 결과를 데이터프레임으로 변환
-        df = pd.DataFrame(extracted_texts)
-        
-        # Google 스프레드시트에 결과 저장 (선택 사항)
-        if sheet:
-            try:
-                # 기존 내용 지우기
-                sheet.clear()
-                
-                # 헤더 추가
-                if ocr_method == "OpenAI (o4-mini)":
-                    sheet.update("A1:B1", [["페이지", "OpenAI 추출 텍스트"]])
-                    # 각 페이지 텍스트 추가
-                    data_to_insert = [[row["페이지"], row["OpenAI 추출 텍스트"]] for row in extracted_texts]
-                elif ocr_method == "Tesseract OCR":
-                    sheet.update("A1:B1", [["페이지", "Tesseract 추출 텍스트"]])
-                    # 각 페이지 텍스트 추가
-                    data_to_insert = [[row["페이지"], row["Tesseract 추출 텍스트"]] for row in extracted_texts]
-                else:
-                    sheet.update("A1:C1", [["페이지", "OpenAI 추출 텍스트", "Tesseract 추출 텍스트"]])
-                    # 각 페이지 텍스트 추가
-                    data_to_insert = [[row["페이지"], row["OpenAI 추출 텍스트"], row["Tesseract 추출 텍스트"]] for row in extracted_texts]
-                
-                if data_to_insert:
-                    if ocr_method == "둘 다 사용":
-                        sheet.update(f"A2:C{len(data_to_insert)+1}", data_to_insert)
-                    else:
-                        sheet.update(f"A2:B{len(data_to_insert)+1}", data_to_insert)
-                
-                # A1 셀에 바로 첫 번째 페이지 내용 넣기
-                if len(extracted_texts) > 0:
-                    if ocr_method == "OpenAI (o4-mini)":
-                        sheet.update("A1", extracted_texts[0]["OpenAI 추출 텍스트"])
-                    elif ocr_method == "Tesseract OCR":
-                        sheet.update("A1", extracted_texts[0]["Tesseract 추출 텍스트"])
-                    else:
-                        sheet.update("A1", extracted_texts[0]["OpenAI 추출 텍스트"])
-                
-                st.success(f"결과가 Google 스프레드시트에 저장되었습니다. ID: {google_sheet_id}")
-            except Exception as e:
-                st.error(f"스프레드시트 저장 오류: {str(e)}")
-        
-        return df
-    except Exception as e:
-        st.error(f"PDF 처리 오류: {str(e)}")
-        return None
-
-# 이미지 파일 처리 함수
-def process_image(image_file, api_key, sheet=None):
-    try:
-        # 이미지 파일 읽기
-        image_bytes = image_file.getvalue()
-        
-        # 이미지 표시
-        img = Image.open(io.BytesIO(image_bytes))
-        st.image(img, caption="업로드된 이미지", use_column_width=True)
-        
-        # 진행 상황 표시
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        status_text.text("이미지 처리 중...")
-        progress_bar.progress(0.3)
-        
-        # 추출 결과를 저장할 딕셔너리
-        results = {}
-        
-        # 선택한 OCR 방법에 따라 텍스트 추출
-        if ocr_method == "OpenAI (o4-mini)" or ocr_method == "둘 다 사용":
-            progress_bar.progress(0.4)
-            status_text.text("OpenAI로 텍스트 추출 중...")
-            openai_text = extract_text_with_openai(image_bytes, 0, api_key)
-            results["OpenAI 추출 텍스트"] = openai_text
-            progress_bar.progress(0.7)
-        
-        if ocr_method == "Tesseract OCR" or ocr_method == "둘 다 사용":
-            progress_bar.progress(0.8)
-            status_text.text("Tesseract OCR로 텍스트 추출 중...")
-            tesseract_text = extract_text_with_tesseract(image_bytes)
-            results["Tesseract 추출 텍스트"] = tesseract_text
-        
-        # 진행 상황 완료
-        progress_bar.progress(1.0)
-        status_text.text("처리 완료!")
-        
-        # Google 스프레드시트에 결과 저장 (선택 사항)
-        if sheet:
-            try:
-                # 기존 내용 지우기
-                sheet.clear()
-                
-                # 결과 저장
-                if ocr_method == "OpenAI (o4-mini)":
-                    sheet.update("A1", "OpenAI 추출 텍스트")
-                    sheet.update("A2", results["OpenAI 추출 텍스트"])
-                elif ocr_method == "Tesseract OCR":
-                    sheet.update("A1", "Tesseract 추출 텍스트")
-                    sheet.update("A2", results["Tesseract 추출 텍스트"])
-                else:
-                    sheet.update("A1:B1", [["OpenAI 추출 텍스트", "Tesseract 추출 텍스트"]])
-                    sheet.update("A2:B2", [[results["OpenAI 추출 텍스트"], results["Tesseract 추출 텍스트"]]])
-                
-                # A1 셀에 OpenAI 결과 또는 Tesseract 결과 중 하나 저장
-                if "OpenAI 추출 텍스트" in results:
-                    sheet.update("A1", results["OpenAI 추출 텍스트"])
-                elif "Tesseract 추출 텍스트" in results:
-                    sheet.update("A1", results["Tesseract 추출 텍스트"])
-                
-                st.success(f"결과가 Google 스프레드시트에 저장되었습니다. ID: {google_sheet_id}")
-            except Exception as e:
-                st.error(f"스프레드시트 저장 오류: {str(e)}")
-        
-        return results
-    except Exception as e:
-        st.error(f"이미지 처리 오류: {str(e)}")
-        return None
-
 # PDF 텍스트 추출 탭
 with tab1:
     st.title("📄 PDF 텍스트 추출 도구")
     st.markdown("PDF 파일을 업로드하면 o4-mini 모델을 사용하여 텍스트를 추출합니다.")
     
     uploaded_pdf = st.file_uploader("PDF 파일 업로드", type=["pdf"], key="pdf_uploader")
+    
+    # 이전 세션에서 제출한 Batch 작업 이어받기
+    batch_id = None
+    if use_batch_api:
+        batch_id = st.text_input(
+            "이전 Batch 작업 ID (선택사항)",
+            help="다른 세션에서 제출한 Batch 작업의 결과를 가져오려면 표시된 작업 ID를 입력하세요. 같은 PDF를 업로드해야 합니다."
+        ).strip() or None
 
     if uploaded_pdf is not None:
         if not api_key and ocr_method != "Tesseract OCR":
@@ -366,7 +84,10 @@ with tab1:
                 
                 # PDF 처리
                 with st.spinner("PDF 처리 중..."):
-                    result_df = process_pdf(uploaded_pdf, api_key, sheet)
+                    result_df = process_pdf(
+                        uploaded_pdf, api_key, ocr_method, sheet, use_batch_api, low_memory_mode,
+                        requests_per_minute, tokens_per_minute, pages_per_request, use_text_layer, batch_id
+                    )
                     
                     if result_df is not None:
                         # 결과 표시
@@ -391,8 +112,10 @@ with tab1:
                         with result_tab2:
                             st.dataframe(result_df)
                         
-                        # CSV 다운로드 버튼
-                        csv = result_df.to_csv(index=False).encode('utf-8')
+                        # CSV 다운로드 버튼 (문자열을 거치지 않고 바로 바이트 버퍼에 기록)
+                        csv = io.BytesIO()
+                        result_df.to_csv(csv, index=False, encoding='utf-8')
+                        csv.seek(0)
                         st.download_button(
                             label="CSV로 다운로드",
                             data=csv,
@@ -420,7 +143,7 @@ with tab2:
                 
                 # 이미지 처리
                 with st.spinner("이미지 처리 중..."):
-                    results = process_image(uploaded_image, api_key, sheet)
+                    results = process_image(uploaded_image, api_key, ocr_method, sheet)
                     
                     if results:
                         # 결과 표시
@@ -437,7 +160,9 @@ with tab2:
                         
                         # CSV 다운로드 버튼
                         df = pd.DataFrame([results])
-                        csv = df.to_csv(index=False).encode('utf-8')
+                        csv = io.BytesIO()
+                        df.to_csv(csv, index=False, encoding='utf-8')
+                        csv.seek(0)
                         st.download_button(
                             label="CSV로 다운로드",
                             data=csv,
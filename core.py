@@ -0,0 +1,973 @@
+# PDF/이미지 텍스트 추출 공통 함수 (Streamlit UI는 app.py에서 구성)
+import streamlit as st
+import requests
+import asyncio
+import httpx
+from aiolimiter import AsyncLimiter
+import base64
+import os
+import tempfile
+import fitz  # PyMuPDF
+import pandas as pd
+import gspread
+from google.oauth2.service_account import Credentials
+from PIL import Image, ImageFilter
+import io
+import json
+import time
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tenacity import (
+    retry, retry_if_exception, retry_if_exception_type, retry_if_result,
+    stop_after_attempt, wait_random_exponential
+)
+import pytesseract
+import numpy as np
+
+# OpenAI API 설정
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+OPENAI_API_URL = f"{OPENAI_BASE_URL}/chat/completions"
+OPENAI_MODEL = "o4-mini"
+MAX_CONCURRENCY = 10  # 동시에 진행할 최대 API 요청 수
+PROGRESS_UPDATE_STEPS = 20  # 문서당 진행 상황 화면 갱신 횟수 (페이지마다 갱신하지 않음)
+REQUESTS_PER_MINUTE = 60  # 분당 최대 API 요청 수 (기본값)
+TOKENS_PER_MINUTE = 200000  # 분당 최대 API 토큰 수 (기본값)
+ESTIMATED_OUTPUT_TOKENS = 1000  # 페이지당 예상 출력 토큰 수 (토큰 한도 계산용)
+IMAGE_PATCH_SIZE = 32  # 패치 단위로 과금되는 모델의 이미지 패치 크기 (픽셀)
+IMAGE_MAX_PATCHES = 1536  # 이미지 한 장당 최대 패치 수
+IMAGE_PATCH_TOKEN_MULTIPLIERS = {"o4-mini": 1.72, "gpt-4.1-mini": 1.62, "gpt-4.1-nano": 2.46}  # 패치 과금 모델별 토큰 배수
+PAGES_PER_REQUEST = 4  # 한 번의 OpenAI 요청으로 묶어 보낼 PDF 페이지 수 (기본값)
+TEXT_LAYER_MIN_CHARS = 50  # OCR을 생략할 텍스트 레이어의 최소 글자 수
+TEXT_LAYER_MIN_PRINTABLE_RATIO = 0.8  # OCR을 생략할 텍스트 레이어의 최소 출력 가능 문자 비율
+CONNECTION_LIMIT = 20  # 최대 동시 연결 수
+OPENAI_TIMEOUT = 120  # API 요청당 최대 대기 시간 (초)
+RENDER_DPI = 150  # PDF 페이지 렌더링 해상도 (비전 모델이 어차피 축소하므로 300 DPI는 불필요)
+JPEG_QUALITY = 85  # OpenAI로 전송할 JPEG 품질
+TESSERACT_DPI = 300  # Tesseract OCR용 PDF 페이지 렌더링 해상도
+PAGE_CACHE_MAX_ENTRIES = 500  # 페이지별 추출 결과 캐시 최대 항목 수
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")  # 더 이상 바뀌지 않는 Batch 작업 상태
+MAX_RETRY_ATTEMPTS = 5  # 일시적 오류(429/5xx) 발생 시 최대 시도 횟수
+
+# 동기 요청용 공유 세션 (TCP/TLS 연결 재사용)
+http_session = requests.Session()
+
+# 재시도 간 기본 대기 시간 (지수 백오프)
+exponential_wait = wait_random_exponential(min=1, max=30)
+
+# 재시도할 응답인지 확인 (요청 한도 초과 또는 서버 오류)
+def is_retryable_response(response):
+    return response.status_code == 429 or response.status_code >= 500
+
+# Retry-After 헤더가 있으면 그만큼, 없으면 지수 백오프로 대기
+def wait_retry_after(retry_state):
+    if not retry_state.outcome.failed:
+        retry_after = retry_state.outcome.result().headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return exponential_wait(retry_state)
+
+# 요청이 서버에 전달되기 전에 실패한 경우만 재시도 (응답 대기 시간 초과는 이미 생성 중일 수 있으므로 재시도하지 않음)
+RETRYABLE_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, requests.ConnectionError)
+
+# OpenAI API 요청 재시도 설정 (마지막 시도의 응답은 호출한 쪽에서 처리)
+openai_retry = retry(
+    wait=wait_retry_after,
+    stop=stop_after_attempt(MAX_RETRY_ATTEMPTS),
+    retry=(
+        retry_if_result(is_retryable_response)
+        | retry_if_exception_type(RETRYABLE_TRANSPORT_ERRORS)
+    ),
+    retry_error_callback=lambda retry_state: retry_state.outcome.result()
+)
+
+# 재시도할 Google 스프레드시트 오류인지 확인
+def is_retryable_sheets_error(exception):
+    return (
+        isinstance(exception, gspread.exceptions.APIError)
+        and is_retryable_response(exception.response)
+    )
+
+# 쓰기 할당량 초과(429) 시 분당 할당량이 초기화되는 다음 분까지 대기
+def wait_sheets_quota(retry_state):
+    if retry_state.outcome.exception().response.status_code == 429:
+        return 60 - time.time() % 60
+    return exponential_wait(retry_state)
+
+# Google 스프레드시트 요청 재시도 설정
+sheets_retry = retry(
+    wait=wait_sheets_quota,
+    stop=stop_after_attempt(MAX_RETRY_ATTEMPTS),
+    retry=retry_if_exception(is_retryable_sheets_error),
+    reraise=True
+)
+
+# OpenAI API 동기 요청 함수 (일시적 오류 시 재시도)
+@openai_retry
+def send_openai_request(method, url, **kwargs):
+    return http_session.request(method, url, **kwargs)
+
+# OpenAI Chat Completions 비동기 요청 함수 (일시적 오류 시 재시도)
+@openai_retry
+async def post_openai_request_async(client, headers, payload, semaphore, request_limiter,
+                                    token_limiter, estimated_tokens):
+    # 동시 요청 수와 분당 요청/토큰 수를 제한하며 API 호출 (재시도 대기 중에는 슬롯을 반납)
+    async with semaphore, request_limiter:
+        await token_limiter.acquire(min(estimated_tokens, token_limiter.max_rate))
+        return await client.post(OPENAI_API_URL, headers=headers, json=payload)
+
+# Google 스프레드시트 연결 함수
+def connect_to_google_sheets(sheet_id):
+    try:
+        # 서비스 계정 정보 (환경 변수 또는 secrets에서 가져옴)
+        # 실제 배포 시에는 Streamlit의 secrets 관리 기능을 사용하는 것이 좋습니다
+        if os.path.exists('service_account.json'):
+            # 로컬 개발 환경
+            creds = Credentials.from_service_account_file(
+                'service_account.json',
+                scopes=['https://www.googleapis.com/auth/spreadsheets',
+                       'https://www.googleapis.com/auth/drive']
+            )
+        else:
+            # Streamlit Cloud 환경
+            service_account_info = st.secrets["gcp_service_account"]
+            creds = Credentials.from_service_account_info(
+                service_account_info,
+                scopes=['https://www.googleapis.com/auth/spreadsheets',
+                       'https://www.googleapis.com/auth/drive']
+            )
+        
+        client = gspread.authorize(creds)
+        sheet = client.open_by_key(sheet_id).sheet1
+        return sheet
+    except Exception as e:
+        st.error(f"Google 스프레드시트 연결 오류: {str(e)}")
+        return None
+
+# Google 스프레드시트 내용을 지우는 함수
+@sheets_retry
+def clear_sheet(sheet):
+    sheet.clear()
+
+# 여러 범위를 한 번의 요청으로 Google 스프레드시트에 저장하는 함수
+@sheets_retry
+def write_sheet_ranges(sheet, ranges):
+    sheet.spreadsheet.values_batch_update({
+        "valueInputOption": "RAW",
+        "data": [
+            {"range": gspread.utils.absolute_range_name(sheet.title, cell_range), "values": values}
+            for cell_range, values in ranges
+        ]
+    })
+
+# 페이지별 추출 결과 캐시 (재실행 간 유지, 오래 사용하지 않은 항목부터 삭제)
+@st.cache_resource
+def get_page_text_cache():
+    return OrderedDict(), threading.Lock()
+
+# 캐시에서 페이지 추출 결과를 가져오는 함수
+def get_cached_page_text(key):
+    cache, lock = get_page_text_cache()
+    with lock:
+        if key not in cache:
+            return None
+        cache.move_to_end(key)
+        return cache[key]
+
+# 페이지 추출 결과를 캐시에 저장하는 함수
+def set_cached_page_text(key, text):
+    cache, lock = get_page_text_cache()
+    with lock:
+        cache[key] = text
+        cache.move_to_end(key)
+        while len(cache) > PAGE_CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+
+# 저메모리 모드에서 PyMuPDF 캐시(디코딩된 이미지/폰트)를 비우는 함수
+def trim_pymupdf_store(low_memory):
+    # PyMuPDF는 현재 캐시 크기를 알려주지 않으므로(TOOLS.store_size는 항상 None) 크기 대신 모드로 판단
+    # 일반 모드는 MuPDF 기본 한도(256MB)에 맡기고, 저메모리 모드는 페이지마다 모두 비움
+    if low_memory:
+        fitz.TOOLS.store_shrink(100)
+
+# PDF 페이지의 텍스트 레이어 추출 함수 (스캔 페이지처럼 쓸 만한 텍스트가 없으면 None)
+def extract_text_layer(doc, page_num):
+    text = doc.load_page(page_num).get_text("text")
+    stripped = text.strip()
+    if len(stripped) <= TEXT_LAYER_MIN_CHARS:
+        return None
+    
+    # 글꼴 인코딩이 깨진 페이지는 대체 문자(U+FFFD)가 많으므로 OCR로 처리
+    printable = sum(1 for ch in stripped if ch.isspace() or (ch.isprintable() and ch != "\ufffd"))
+    if printable / len(stripped) <= TEXT_LAYER_MIN_PRINTABLE_RATIO:
+        return None
+    return text
+
+# PDF 페이지를 이미지로 변환하는 함수 (JPEG 바이트와 (너비, 높이) 반환, 변환 오류는 호출한 쪽에서 처리)
+def convert_pdf_page_to_image(doc, page_num, low_memory=False):
+    # 이미 열려 있는 PyMuPDF 문서에서 페이지를 이미지로 변환
+    if page_num >= doc.page_count:
+        return None
+    
+    page = doc.load_page(page_num)
+    pix = page.get_pixmap(matrix=fitz.Matrix(RENDER_DPI/72, RENDER_DPI/72))
+    
+    # PNG 대신 JPEG로 바로 인코딩하여 전송 크기 축소
+    img_bytes = pix.pil_tobytes(format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    # 토큰 수 추정용 크기는 JPEG를 다시 열지 않고 Pixmap에서 가져옴
+    size = (pix.width, pix.height)
+    
+    # 다음 페이지 전에 Pixmap을 해제하고 캐시 크기 제한
+    pix = None
+    trim_pymupdf_store(low_memory)
+    return img_bytes, size
+
+# 이미지를 Base64 data URL로 인코딩하는 함수
+def encode_image_data_url(image_bytes, mime_type="image/jpeg"):
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+    return f"data:{mime_type};base64,{base64_image}"
+
+# OpenAI API 요청 헤더와 페이로드 구성 함수 (이미 인코딩한 data URL이 있으면 재사용)
+def build_openai_request(image_bytes, api_key, mime_type="image/jpeg", image_url=None):
+    if image_url is None:
+        image_url = encode_image_data_url(image_bytes, mime_type)
+    
+    # OpenAI API 요청 설정
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    
+    # 요청 페이로드 구성 - Chat Completions API 사용
+    payload = {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "수식은 LaTeX형식으로 제공해줘. 이미지의 모든 텍스트 내용을 추출해서 원본 서식을 최대한 유지하며 보여줘."
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"이 이미지에서 모든 텍스트를 추출해줘."
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url,
+                            "detail": "high"
+                        }
+                    }
+                ]
+            }
+        ]
+    }
+    return headers, payload
+
+# 이미지 한 장의 입력 토큰 수 추정 (모델에 따라 32px 패치 또는 detail: high 기준 512px 타일 계산)
+def estimate_image_tokens(width, height, model=OPENAI_MODEL):
+    if model in IMAGE_PATCH_TOKEN_MULTIPLIERS:
+        patches = math.ceil(width / IMAGE_PATCH_SIZE) * math.ceil(height / IMAGE_PATCH_SIZE)
+        if patches > IMAGE_MAX_PATCHES:
+            # 비율을 유지하며 축소한 뒤 패치 경계에 맞도록 한 번 더 축소
+            scale = math.sqrt(IMAGE_PATCH_SIZE ** 2 * IMAGE_MAX_PATCHES / (width * height))
+            columns, rows = width * scale / IMAGE_PATCH_SIZE, height * scale / IMAGE_PATCH_SIZE
+            scale *= min(math.floor(columns) / columns, math.floor(rows) / rows)
+            patches = math.ceil(width * scale / IMAGE_PATCH_SIZE) * math.ceil(height * scale / IMAGE_PATCH_SIZE)
+        return math.ceil(min(patches, IMAGE_MAX_PATCHES) * IMAGE_PATCH_TOKEN_MULTIPLIERS[model])
+    
+    # 2048px 안으로 축소한 뒤 짧은 변을 768px로 축소하여 512px 타일 수 계산
+    scale = min(1, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+# 요청 하나의 토큰 수 추정 (이미지 입력 토큰 + 페이지별 예상 출력 토큰)
+def estimate_request_tokens(image_sizes):
+    return sum(estimate_image_tokens(width, height) + ESTIMATED_OUTPUT_TOKENS for width, height in image_sizes)
+
+# OpenAI API 응답에서 모델이 생성한 텍스트만 추출 (내용이 없으면 None)
+def get_openai_content(result):
+    if "choices" in result and len(result["choices"]) > 0:
+        return result["choices"][0]["message"].get("content")
+    return None
+
+# OpenAI API 응답에서 텍스트 추출
+def parse_openai_result(result):
+    content = get_openai_content(result)
+    return content if content is not None else "OpenAI로 텍스트를 추출하지 못했습니다."
+
+# 여러 페이지 이미지를 한 번에 보내는 요청 헤더와 페이로드 구성 함수
+def build_openai_multi_page_request(image_urls, page_nums, api_key):
+    headers, payload = build_openai_request(None, api_key, image_url=image_urls[0])
+    
+    # 프롬프트는 한 번만 보내고 페이지 번호를 키로 하는 JSON으로 결과를 받음
+    page_labels = ", ".join(str(page_num + 1) for page_num in page_nums)
+    content = [
+        {
+            "type": "text",
+            "text": (
+                f"아래 이미지들은 순서대로 PDF의 {page_labels} 페이지야. "
+                "각 이미지에서 모든 텍스트를 추출해서 페이지 번호를 키로, 추출한 텍스트를 값으로 하는 "
+                f"JSON 객체로만 답해줘. 예: {{\"{page_nums[0] + 1}\": \"...\"}}"
+            )
+        }
+    ]
+    for image_url in image_urls:
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image_url,
+                "detail": "high"
+            }
+        })
+    
+    payload["messages"][1]["content"] = content
+    payload["response_format"] = {"type": "json_object"}
+    return headers, payload
+
+# 여러 페이지 요청의 JSON 응답을 페이지별 텍스트로 나누는 함수 (실패 시 None)
+def parse_openai_multi_page_result(result, page_nums):
+    try:
+        data = json.loads(get_openai_content(result))
+        texts = {}
+        for page_num in page_nums:
+            text = data[str(page_num + 1)]
+            # 내용이 빠진 페이지가 있으면 페이지별 요청으로 다시 처리
+            if text is None:
+                return None
+            texts[page_num] = text if isinstance(text, str) else json.dumps(text, ensure_ascii=False)
+        return texts
+    except (ValueError, KeyError, TypeError):
+        return None
+
+# OpenAI API를 사용하여 이미지에서 텍스트 추출 함수 (단일 이미지용)
+def extract_text_with_openai(image_bytes, page_num, api_key, mime_type="image/png"):
+    try:
+        headers, payload = build_openai_request(image_bytes, api_key, mime_type)
+        
+        # API 호출
+        response = send_openai_request(
+            "POST",
+            OPENAI_API_URL,
+            headers=headers,
+            json=payload
+        )
+        
+        # 응답 확인
+        if response.status_code == 200:
+            return parse_openai_result(response.json())
+        else:
+            st.error(f"API 오류 ({response.status_code}): {response.text}")
+            return f"OpenAI API 오류가 발생했습니다."
+    except Exception as e:
+        st.error(f"OpenAI 텍스트 추출 오류: {str(e)}")
+        return f"OpenAI 텍스트 추출 중 오류 발생: {str(e)}"
+
+# OpenAI API를 비동기로 호출하여 이미지에서 텍스트 추출 함수
+async def extract_text_async(client, image_bytes, image_size, page_num, api_key, semaphore, request_limiter,
+                             token_limiter, cache_key=None, image_url=None):
+    try:
+        headers, payload = build_openai_request(image_bytes, api_key, image_url=image_url)
+        
+        response = await post_openai_request_async(
+            client, headers, payload, semaphore, request_limiter,
+            token_limiter, estimate_request_tokens([image_size])
+        )
+        
+        # 응답 확인
+        if response.status_code == 200:
+            result = response.json()
+            text = parse_openai_result(result)
+            # 모델이 실제로 돌려준 텍스트만 캐시 (내용 없는 응답의 안내 문구는 캐시하지 않음)
+            if cache_key and get_openai_content(result) is not None:
+                set_cached_page_text(cache_key, text)
+            return text
+        else:
+            st.error(f"API 오류 ({response.status_code}, 페이지 {page_num + 1}): {response.text}")
+            return f"OpenAI API 오류가 발생했습니다."
+    except Exception as e:
+        st.error(f"OpenAI 텍스트 추출 오류 (페이지 {page_num + 1}): {str(e)}")
+        return f"OpenAI 텍스트 추출 중 오류 발생: {str(e)}"
+
+# 여러 페이지 이미지를 한 번의 OpenAI 요청으로 처리하는 함수 (페이지 번호별 텍스트 반환)
+async def extract_texts_async(client, images, image_sizes, page_nums, api_key, semaphore, request_limiter,
+                              token_limiter, cache_keys):
+    # 묶음 요청과 페이지별 재요청에서 같은 인코딩 결과를 재사용
+    image_urls = [encode_image_data_url(image_bytes) for image_bytes in images]
+    
+    async def extract_each_page():
+        texts = await asyncio.gather(*[
+            extract_text_async(
+                client, image_bytes, image_size, page_num, api_key, semaphore, request_limiter,
+                token_limiter, cache_key, image_url
+            )
+            for image_bytes, image_size, page_num, cache_key, image_url
+            in zip(images, image_sizes, page_nums, cache_keys, image_urls)
+        ])
+        return dict(zip(page_nums, texts))
+    
+    if len(images) == 1:
+        return await extract_each_page()
+    
+    page_labels = ", ".join(str(page_num + 1) for page_num in page_nums)
+    try:
+        headers, payload = build_openai_multi_page_request(image_urls, page_nums, api_key)
+        
+        response = await post_openai_request_async(
+            client, headers, payload, semaphore, request_limiter,
+            token_limiter, estimate_request_tokens(image_sizes)
+        )
+        
+        # 응답 확인
+        if response.status_code != 200:
+            st.error(f"API 오류 ({response.status_code}, 페이지 {page_labels}): {response.text}")
+            return {page_num: "OpenAI API 오류가 발생했습니다." for page_num in page_nums}
+        
+        texts = parse_openai_multi_page_result(response.json(), page_nums)
+    except Exception as e:
+        st.error(f"OpenAI 텍스트 추출 오류 (페이지 {page_labels}): {str(e)}")
+        return {page_num: f"OpenAI 텍스트 추출 중 오류 발생: {str(e)}" for page_num in page_nums}
+    
+    # 응답을 페이지별로 나누지 못하면 페이지마다 따로 요청
+    if texts is None:
+        return await extract_each_page()
+    
+    for page_num, cache_key in zip(page_nums, cache_keys):
+        set_cached_page_text(cache_key, texts[page_num])
+    return texts
+
+# 페이지별 추출 결과 캐시 키 (PDF 해시, 페이지 번호, 렌더링 해상도, 모델)
+def openai_cache_key(pdf_hash, page_num):
+    return (pdf_hash, page_num, RENDER_DPI, OPENAI_MODEL)
+
+def tesseract_cache_key(pdf_hash, page_num):
+    return (pdf_hash, page_num, TESSERACT_DPI, "tesseract")
+
+# PDF 페이지 변환과 텍스트 추출을 겹쳐서 처리하는 함수
+async def process_pages_async(doc, pdf_hash, api_key, render_images, use_openai, use_tesseract,
+                              low_memory=False, requests_per_minute=REQUESTS_PER_MINUTE,
+                              tokens_per_minute=TOKENS_PER_MINUTE, pages_per_request=PAGES_PER_REQUEST,
+                              use_text_layer=True, on_page_done=None):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    request_limiter = AsyncLimiter(requests_per_minute, 60)
+    token_limiter = AsyncLimiter(tokens_per_minute, 60)
+    # HTTP/2 연결 하나에 요청을 다중화하여 페이지마다 TLS 핸드셰이크를 반복하지 않음
+    client = httpx.AsyncClient(
+        http2=True, timeout=OPENAI_TIMEOUT, limits=httpx.Limits(max_connections=CONNECTION_LIMIT)
+    )
+    
+    # PyMuPDF 문서는 스레드 안전하지 않으므로 변환은 전용 스레드 하나에서 순서대로 수행
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        async with client:
+            async def render_page(page_num):
+                # 페이지 변환 중에도 앞 페이지의 API 요청이 계속 진행됨
+                try:
+                    result = await loop.run_in_executor(
+                        executor, convert_pdf_page_to_image, doc, page_num, low_memory
+                    )
+                    if result is None:
+                        return None
+                    image_bytes, image_sizes[page_num] = result
+                    return image_bytes
+                except Exception as e:
+                    st.error(f"PDF 페이지 변환 오류 (페이지 {page_num + 1}): {str(e)}")
+                    return None
+            
+            async def extract_group_with_openai(page_nums):
+                # 진행 중인 묶음 수만큼만 미리 변환하여 문서 전체의 이미지가 메모리에 쌓이지 않게 함
+                async with group_slots:
+                    images = []
+                    for page_num in page_nums:
+                        image_bytes = await render_page(page_num)
+                        # 페이지별 처리에는 변환 성공 여부만 알리고 이미지는 요청이 끝나면 해제
+                        rendered[page_num].set_result(image_bytes is not None)
+                        images.append(image_bytes)
+                    
+                    # 변환에 성공한 페이지만 한 번에 요청
+                    targets = [(page_num, image_bytes) for page_num, image_bytes in zip(page_nums, images) if image_bytes]
+                    if not targets:
+                        return {}
+                    return await extract_texts_async(
+                        client, [image_bytes for _, image_bytes in targets],
+                        [image_sizes[page_num] for page_num, _ in targets], [page_num for page_num, _ in targets],
+                        api_key, semaphore, request_limiter, token_limiter,
+                        [openai_cache_key(pdf_hash, page_num) for page_num, _ in targets]
+                    )
+            
+            async def extract_with_openai(page_num):
+                if page_num in text_layer_texts:
+                    return text_layer_texts[page_num]
+                if page_num in cached_openai_texts:
+                    return cached_openai_texts[page_num]
+                if page_num in group_tasks:
+                    return (await group_tasks[page_num]).get(page_num)
+                return None
+            
+            async def extract_with_tesseract(page_num):
+                if not use_tesseract:
+                    return None
+                if page_num in text_layer_texts:
+                    return text_layer_texts[page_num]
+                cache_key = tesseract_cache_key(pdf_hash, page_num)
+                cached_text = get_cached_page_text(cache_key)
+                if cached_text is not None:
+                    return cached_text
+                try:
+                    text = await loop.run_in_executor(
+                        executor, extract_text_from_pdf_page_with_tesseract, doc, page_num, low_memory
+                    )
+                    set_cached_page_text(cache_key, text)
+                    return text
+                except Exception as e:
+                    st.error(f"Tesseract OCR 오류 (페이지 {page_num + 1}): {str(e)}")
+                    return f"Tesseract OCR 중 오류 발생: {str(e)}"
+            
+            async def process_page(page_num):
+                image_bytes = None
+                rendered_ok = True
+                if page_num in rendered:
+                    # 묶음 요청에서 이 페이지의 변환이 끝난 뒤 OCR 진행
+                    rendered_ok = await rendered[page_num]
+                elif page_num in batch_pages:
+                    # Batch 요청에 넣을 페이지만 이미지를 결과로 돌려줌
+                    image_bytes = await render_page(page_num)
+                    rendered_ok = image_bytes is not None
+                if not rendered_ok:
+                    if on_page_done:
+                        on_page_done()
+                    return None
+                
+                openai_text, tesseract_text = await asyncio.gather(
+                    extract_with_openai(page_num),
+                    extract_with_tesseract(page_num)
+                )
+                if on_page_done:
+                    on_page_done()
+                return image_bytes, openai_text, tesseract_text
+            
+            # 텍스트 레이어가 있는 페이지는 변환과 OCR 없이 바로 사용
+            text_layer_texts = {}
+            if use_text_layer:
+                for page_num in range(doc.page_count):
+                    text = extract_text_layer(doc, page_num)
+                    if text:
+                        text_layer_texts[page_num] = text
+            
+            # 이미 추출한 페이지는 변환과 API 호출을 생략
+            cached_openai_texts = {}
+            render_pages = []
+            if render_images:
+                for page_num in range(doc.page_count):
+                    if page_num in text_layer_texts:
+                        continue
+                    cached_text = get_cached_page_text(openai_cache_key(pdf_hash, page_num))
+                    if cached_text is None:
+                        render_pages.append(page_num)
+                    else:
+                        cached_openai_texts[page_num] = cached_text
+            
+            # 나머지 페이지는 여러 장씩 묶어 한 번의 요청으로 처리
+            image_sizes = {}
+            rendered = {}
+            group_tasks = {}
+            group_slots = asyncio.Semaphore(MAX_CONCURRENCY)
+            if use_openai:
+                for start in range(0, len(render_pages), pages_per_request):
+                    group = render_pages[start:start + pages_per_request]
+                    for page_num in group:
+                        rendered[page_num] = loop.create_future()
+                    group_task = asyncio.ensure_future(extract_group_with_openai(group))
+                    for page_num in group:
+                        group_tasks[page_num] = group_task
+            # Batch 모드에서는 모든 페이지 이미지를 모아 한 번에 제출
+            batch_pages = set() if use_openai else set(render_pages)
+            
+            tasks = [process_page(i) for i in range(doc.page_count)]
+            return await asyncio.gather(*tasks)
+
+# OpenAI Batch 작업 제출 함수 (페이지별 요청을 JSONL 파일로 올린 뒤 작업 생성)
+def submit_openai_batch(images, api_key, pdf_hash):
+    auth_headers = {"Authorization": f"Bearer {api_key}"}
+    
+    # 페이지별 요청을 JSONL 파일로 구성
+    lines = []
+    for i, image_bytes in enumerate(images):
+        if not image_bytes:
+            continue
+        _, payload = build_openai_request(image_bytes, api_key)
+        lines.append(json.dumps({
+            "custom_id": f"page-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": payload
+        }, ensure_ascii=False))
+    batch_data = "\n".join(lines).encode("utf-8")
+    
+    # 입력 파일 업로드
+    response = send_openai_request(
+        "POST",
+        f"{OPENAI_BASE_URL}/files",
+        headers=auth_headers,
+        data={"purpose": "batch"},
+        files={"file": ("batch_input.jsonl", batch_data, "application/jsonl")}
+    )
+    response.raise_for_status()
+    input_file_id = response.json()["id"]
+    
+    # Batch 작업 생성 (나중에 결과를 가져올 때 같은 PDF인지 확인할 수 있도록 해시를 함께 저장)
+    response = send_openai_request(
+        "POST",
+        f"{OPENAI_BASE_URL}/batches",
+        headers=auth_headers,
+        json={
+            "input_file_id": input_file_id,
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+            "metadata": {"pdf_hash": pdf_hash}
+        }
+    )
+    response.raise_for_status()
+    return response.json()
+
+# OpenAI Batch 작업 상태 조회 함수
+def get_openai_batch(batch_id, api_key):
+    response = send_openai_request(
+        "GET",
+        f"{OPENAI_BASE_URL}/batches/{batch_id}",
+        headers={"Authorization": f"Bearer {api_key}"}
+    )
+    response.raise_for_status()
+    return response.json()
+
+# 끝난 OpenAI Batch 작업의 결과를 페이지 번호별로 가져오는 함수
+def fetch_openai_batch_results(batch, api_key, pdf_hash):
+    if not batch.get("output_file_id"):
+        raise RuntimeError(f"Batch 작업 오류 (상태: {batch['status']}): {batch.get('errors')}")
+    
+    # 결과 파일 다운로드
+    response = send_openai_request(
+        "GET",
+        f"{OPENAI_BASE_URL}/files/{batch['output_file_id']}/content",
+        headers={"Authorization": f"Bearer {api_key}"}
+    )
+    response.raise_for_status()
+    
+    # custom_id로 페이지별 결과 정리
+    results = {}
+    for line in response.text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        page_response = item.get("response")
+        if page_response and page_response.get("status_code") == 200:
+            page_num = int(item["custom_id"].split("-")[1])
+            results[page_num] = parse_openai_result(page_response["body"])
+            # 모델이 실제로 돌려준 텍스트만 캐시
+            if get_openai_content(page_response["body"]) is not None:
+                set_cached_page_text(openai_cache_key(pdf_hash, page_num), results[page_num])
+    return results
+
+# OpenAI Batch 작업을 제출하거나 이전에 제출한 작업의 결과를 가져오는 함수
+# (완료될 때까지 기다리지 않고, 작업이 진행 중이면 None 반환)
+def run_openai_batch(images, api_key, pdf_hash, batch_id=None):
+    batches = st.session_state.setdefault("openai_batches", {})
+    if batch_id is None:
+        batch = submit_openai_batch(images, api_key, pdf_hash)
+    else:
+        batch = get_openai_batch(batch_id, api_key)
+        if (batch.get("metadata") or {}).get("pdf_hash") != pdf_hash:
+            raise ValueError(f"Batch 작업 {batch_id}은(는) 업로드한 PDF로 만든 작업이 아닙니다.")
+    batches[pdf_hash] = batch["id"]
+    
+    if batch["status"] not in BATCH_FINAL_STATUSES:
+        st.info(
+            f"OpenAI Batch 작업 진행 중 (ID: {batch['id']}, 상태: {batch['status']}). "
+            "잠시 후 같은 PDF로 다시 실행하면 결과를 가져옵니다."
+        )
+        return None
+    
+    # 끝난 작업은 다음 실행에서 다시 조회하지 않음
+    del batches[pdf_hash]
+    return fetch_openai_batch_results(batch, api_key, pdf_hash)
+
+# 회색조 NumPy 배열의 Otsu 임계값 계산 함수 (히스토그램 기반)
+def otsu_threshold(gray):
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    
+    # 임계값별 배경/전경 화소 수와 평균 밝기
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_bg[-1] - sum_bg) / weight_fg
+        # 클래스 간 분산이 최대가 되는 값을 임계값으로 사용
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(np.nan_to_num(variance)))
+
+# Tesseract OCR용 전처리 후 텍스트 인식 (회색조 NumPy 배열 입력)
+def recognize_text_with_tesseract(gray):
+    # 노이즈 제거
+    gray = np.asarray(Image.fromarray(gray).filter(ImageFilter.MedianFilter(3)))
+    # 이진화
+    thresh = np.where(gray > otsu_threshold(gray), 255, 0).astype(np.uint8)
+    
+    # Tesseract OCR로 텍스트 추출
+    text = pytesseract.image_to_string(Image.fromarray(thresh), lang='kor+eng')
+    
+    return text if text.strip() else "Tesseract OCR로 텍스트를 추출하지 못했습니다."
+
+# Tesseract OCR을 사용하여 이미지에서 텍스트 추출
+def extract_text_with_tesseract(image_bytes):
+    try:
+        # 이미지를 회색조로 디코딩하여 NumPy 배열로 변환
+        gray = np.asarray(Image.open(io.BytesIO(image_bytes)).convert("L"))
+        return recognize_text_with_tesseract(gray)
+    except Exception as e:
+        st.error(f"Tesseract OCR 오류: {str(e)}")
+        return f"Tesseract OCR 중 오류 발생: {str(e)}"
+
+# Tesseract OCR을 사용하여 PyMuPDF Pixmap에서 텍스트 추출 (PNG 인코딩/디코딩 생략)
+def extract_text_with_tesseract_from_pixmap(pix):
+    # samples는 버퍼를 복사한 bytes이므로 samples_mv로 Pixmap 버퍼를 복사 없이 NumPy 배열로 사용
+    arr = np.frombuffer(pix.samples_mv, np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 1:
+        gray = arr[:, :, 0]
+    else:
+        gray = np.asarray(Image.fromarray(arr[:, :, :3]).convert("L"))
+    return recognize_text_with_tesseract(gray)
+
+# PDF 페이지를 회색조로 렌더링하여 Tesseract OCR로 텍스트 추출 (오류는 호출한 쪽에서 처리)
+def extract_text_from_pdf_page_with_tesseract(doc, page_num, low_memory=False):
+    page = doc.load_page(page_num)
+    # 회색조로 바로 렌더링하여 색 변환 생략
+    pix = page.get_pixmap(matrix=fitz.Matrix(TESSERACT_DPI/72, TESSERACT_DPI/72), colorspace=fitz.csGRAY)
+    text = extract_text_with_tesseract_from_pixmap(pix)
+    
+    # 다음 페이지 전에 Pixmap을 해제하고 캐시 크기 제한
+    pix = None
+    trim_pymupdf_store(low_memory)
+    return text
+
+# PDF 처리 함수
+def process_pdf(pdf_file, api_key, ocr_method, sheet=None, use_batch_api=False, low_memory_mode=False,
+                requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                pages_per_request=PAGES_PER_REQUEST, use_text_layer=True, batch_id=None):
+    status = None
+    try:
+        # PDF 파일을 한 번만 읽어서 문서 열기
+        pdf_bytes = pdf_file.getvalue()
+        pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        page_count = doc.page_count
+        
+        st.info(f"PDF 파일: {pdf_file.name}, 총 {page_count} 페이지")
+        
+        # 진행 상황 표시 (상태 컨테이너는 접은 채로 라벨만 갱신)
+        progress_bar = st.progress(0)
+        status = st.status("PDF 처리 중...", expanded=False)
+        progress_step = max(1, page_count // PROGRESS_UPDATE_STEPS)
+        
+        # Batch API는 모든 페이지 변환이 끝난 뒤 한 번에 요청
+        use_openai = ocr_method != "Tesseract OCR"
+        use_tesseract = ocr_method != "OpenAI (o4-mini)"
+        use_batch = use_openai and use_batch_api and page_count > 1
+        # 이 PDF로 제출한 Batch 작업이 있으면 페이지를 다시 변환하지 않고 결과만 확인
+        if use_batch:
+            batch_id = batch_id or st.session_state.get("openai_batches", {}).get(pdf_hash)
+        resume_batch = use_batch and batch_id is not None
+        # Batch 모드에서는 결과를 받기 전까지 진행률을 절반까지만 표시
+        page_progress = 0.5 if use_batch else 1.0
+        completed = 0
+        
+        def on_page_done():
+            nonlocal completed
+            completed += 1
+            # 일정 페이지마다만 화면을 갱신하여 브라우저로 보내는 업데이트 수 제한
+            if completed % progress_step == 0 or completed == page_count:
+                status.update(label=f"페이지 {completed}/{page_count} {'변환' if use_batch else '처리'} 완료")
+                progress_bar.progress(completed / page_count * page_progress)
+        
+        # 페이지 변환과 텍스트 추출을 동시에 진행
+        try:
+            page_results = asyncio.run(
+                process_pages_async(
+                    doc, pdf_hash, api_key, use_openai and not resume_batch, use_openai and not use_batch, use_tesseract,
+                    low_memory_mode, requests_per_minute, tokens_per_minute, pages_per_request,
+                    use_text_layer, on_page_done
+                )
+            )
+        finally:
+            doc.close()
+        
+        openai_texts = [result[1] if result else None for result in page_results]
+        # 캐시된 페이지는 이미지를 만들지 않았으므로 Batch 요청에서 제외됨
+        page_images = [result[0] if result else None for result in page_results]
+        if resume_batch or (use_batch and any(page_images)):
+            # Batch API로 모든 페이지를 한 번에 처리 (스크립트를 붙잡고 기다리지 않음)
+            status.update(label="OpenAI Batch 작업 확인 중...")
+            batch_error = "OpenAI API 오류가 발생했습니다."
+            try:
+                batch_results = run_openai_batch(page_images, api_key, pdf_hash, batch_id)
+            except Exception as e:
+                st.error(f"OpenAI Batch 처리 오류: {str(e)}")
+                batch_results = {}
+                batch_error = f"OpenAI 텍스트 추출 중 오류 발생: {str(e)}"
+            
+            if batch_results is None:
+                status.update(label="OpenAI Batch 작업 결과 대기 중", state="complete")
+                return None
+            
+            # Batch 결과에 없는 페이지는 이전 실행에서 캐시된 결과 사용
+            for i in range(page_count):
+                if openai_texts[i] is None and page_results[i]:
+                    openai_texts[i] = batch_results.get(i)
+                    if openai_texts[i] is None:
+                        openai_texts[i] = get_cached_page_text(openai_cache_key(pdf_hash, i)) or batch_error
+        
+        # 추출 결과를 저장할 리스트
+        extracted_texts = []
+        
+        # 각 페이지 결과 정리
+        for i, result in enumerate(page_results):
+            if result:
+                tesseract_text = result[2]
+                # 선택한 OCR 방법에 따라 결과 저장
+                if ocr_method == "OpenAI (o4-mini)":
+                    extracted_texts.append({
+                        "페이지": i + 1,
+                        "OpenAI 추출 텍스트": openai_texts[i]
+                    })
+                elif ocr_method == "Tesseract OCR":
+                    extracted_texts.append({
+                        "페이지": i + 1,
+                        "Tesseract 추출 텍스트": tesseract_text
+                    })
+                else:  # 둘 다 사용
+                    extracted_texts.append({
+                        "페이지": i + 1,
+                        "OpenAI 추출 텍스트": openai_texts[i],
+                        "Tesseract 추출 텍스트": tesseract_text
+                    })
+            else:
+                extracted_texts.append({
+                    "페이지": i + 1,
+                    "OpenAI 추출 텍스트": "페이지 변환 실패",
+                    "Tesseract 추출 텍스트": "페이지 변환 실패"
+                })
+        
+        # 진행 상황 완료
+        progress_bar.progress(1.0)
+        status.update(label="처리 완료!", state="complete")
+        
+        # 결과를 데이터프레임으로 변환
+        df = pd.DataFrame(extracted_texts)
+        
+        # Google 스프레드시트에 결과 저장 (선택 사항)
+        if sheet:
+            try:
+                # 기존 내용 지우기
+                clear_sheet(sheet)
+                
+                # 선택한 OCR 방법에 따라 헤더와 각 페이지 텍스트 구성
+                if ocr_method == "OpenAI (o4-mini)":
+                    header = ["페이지", "OpenAI 추출 텍스트"]
+                    data_to_insert = [[row["페이지"], row["OpenAI 추출 텍스트"]] for row in extracted_texts]
+                elif ocr_method == "Tesseract OCR":
+                    header = ["페이지", "Tesseract 추출 텍스트"]
+                    data_to_insert = [[row["페이지"], row["Tesseract 추출 텍스트"]] for row in extracted_texts]
+                else:
+                    header = ["페이지", "OpenAI 추출 텍스트", "Tesseract 추출 텍스트"]
+                    data_to_insert = [[row["페이지"], row["OpenAI 추출 텍스트"], row["Tesseract 추출 텍스트"]] for row in extracted_texts]
+                
+                # 헤더와 데이터를 한 번의 요청으로 저장
+                last_column = "C" if ocr_method == "둘 다 사용" else "B"
+                ranges = [(f"A1:{last_column}1", [header])]
+                if data_to_insert:
+                    ranges.append((f"A2:{last_column}{len(data_to_insert)+1}", data_to_insert))
+                write_sheet_ranges(sheet, ranges)
+                
+                st.success(f"결과가 Google 스프레드시트에 저장되었습니다. ID: {sheet.spreadsheet.id}")
+            except Exception as e:
+                st.error(f"스프레드시트 저장 오류: {str(e)}")
+        
+        return df
+    except Exception as e:
+        # 상태 컨테이너가 계속 실행 중으로 남지 않도록 오류 상태로 전환
+        if status is not None:
+            status.update(state="error")
+        st.error(f"PDF 처리 오류: {str(e)}")
+        return None
+
+# 이미지 파일 처리 함수
+def process_image(image_file, api_key, ocr_method, sheet=None):
+    try:
+        # 이미지 파일 읽기
+        image_bytes = image_file.getvalue()
+        
+        # 이미지 표시 (Streamlit이 내부에서 이미지를 열어 형식과 크기를 확인함)
+        st.image(image_bytes, caption="업로드된 이미지", use_column_width=True)
+        
+        # 진행 상황 표시
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+        status_text.text("이미지 처리 중...")
+        progress_bar.progress(0.3)
+        
+        # 추출 결과를 저장할 딕셔너리
+        results = {}
+        
+        # 선택한 OCR 방법에 따라 텍스트 추출
+        if ocr_method == "OpenAI (o4-mini)" or ocr_method == "둘 다 사용":
+            progress_bar.progress(0.4)
+            status_text.text("OpenAI로 텍스트 추출 중...")
+            openai_text = extract_text_with_openai(image_bytes, 0, api_key)
+            results["OpenAI 추출 텍스트"] = openai_text
+            progress_bar.progress(0.7)
+        
+        if ocr_method == "Tesseract OCR" or ocr_method == "둘 다 사용":
+            progress_bar.progress(0.8)
+            status_text.text("Tesseract OCR로 텍스트 추출 중...")
+            tesseract_text = extract_text_with_tesseract(image_bytes)
+            results["Tesseract 추출 텍스트"] = tesseract_text
+        
+        # 진행 상황 완료
+        progress_bar.progress(1.0)
+        status_text.text("처리 완료!")
+        
+        # Google 스프레드시트에 결과 저장 (선택 사항)
+        if sheet:
+            try:
+                # 기존 내용 지우기
+                clear_sheet(sheet)
+                
+                # 헤더와 결과를 한 번의 요청으로 저장
+                if ocr_method == "OpenAI (o4-mini)":
+                    write_sheet_ranges(sheet, [("A1:A2", [["OpenAI 추출 텍스트"], [results["OpenAI 추출 텍스트"]]])])
+                elif ocr_method == "Tesseract OCR":
+                    write_sheet_ranges(sheet, [("A1:A2", [["Tesseract 추출 텍스트"], [results["Tesseract 추출 텍스트"]]])])
+                else:
+                    write_sheet_ranges(sheet, [
+                        ("A1:B1", [["OpenAI 추출 텍스트", "Tesseract 추출 텍스트"]]),
+                        ("A2:B2", [[results["OpenAI 추출 텍스트"], results["Tesseract 추출 텍스트"]]])
+                    ])
+                
+                st.success(f"결과가 Google 스프레드시트에 저장되었습니다. ID: {sheet.spreadsheet.id}")
+            except Exception as e:
+                st.error(f"스프레드시트 저장 오류: {str(e)}")
+        
+        return results
+    except Exception as e:
+        st.error(f"이미지 처리 오류: {str(e)}")
+        return None